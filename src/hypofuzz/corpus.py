@@ -29,15 +29,13 @@ class HowGenerated(enum.Enum):
     shrinking = "shrinking"
 
 
-def sort_key(buffer: Union[bytes, ConjectureResult]) -> tuple[int, bytes]:
+def sort_key(buffer: bytes) -> tuple[int, bytes]:
     """Sort our buffers in shortlex order.
 
     See `hypothesis.internal.conjecture.shrinker.sort_key` for details on why we
-    use shortlex order in particular.  This tweaked version is identical except
-    for handling ConjectureResult objects too.
+    use shortlex order in particular.  This is called for every comparison and
+    insertion in the pool, so callers with a ConjectureResult pass `.buffer`.
     """
-    if isinstance(buffer, ConjectureResult):
-        buffer = buffer.buffer
     return (len(buffer), buffer)
 
 
@@ -146,13 +144,17 @@ class Pool:
         # execution, either passing or possibly failing.
         branches = result.extra_information.branches
         buf = result.buffer
+        buf_key = sort_key(buf)
+        # Comparing against the `.keys()` view checks each of our branches in turn,
+        # where `branches.issubset(counter)` would first copy the whole counter.
+        seen_all_branches = branches <= self.arc_counts.keys()
 
         # If the example is "interesting", i.e. the test failed, add the buffer to
         # the database under Hypothesis' default key so it will be reproduced.
         if result.status == Status.INTERESTING:
             origin = result.interesting_origin
             if origin not in self.interesting_examples or (
-                sort_key(result) < sort_key(self.interesting_examples[origin][0])
+                buf_key < sort_key(self.interesting_examples[origin][0].buffer)
             ):
                 self._database.save(self._key, result.buffer)
                 self.interesting_examples[origin] = (
@@ -168,12 +170,11 @@ class Pool:
 
         # If we haven't just discovered new branches and our example is larger than the
         # current largest minimal example, we can skip the expensive calculation.
-        if (not branches.issubset(self.arc_counts)) or (
+        if (not seen_all_branches) or (
             self.results
-            and sort_key(result.buffer)
-            < sort_key(self.results.keys()[-1])  # type: ignore
+            and buf_key < sort_key(self.results.keys()[-1])  # type: ignore
             and any(
-                sort_key(buf) < sort_key(known_buf)
+                buf_key < sort_key(known_buf)
                 for arc, known_buf in self.covering_buffers.items()
                 if arc in branches
             )
@@ -197,8 +198,8 @@ class Pool:
                         self.covering_buffers[arc] = res.buffer
             # We add newly-discovered branches to the counter later; so here our only
             # unseen branches should be the newly discovered branches.
-            assert seen_branches - set(self.arc_counts) == branches - set(
-                self.arc_counts
+            assert seen_branches - self.arc_counts.keys() == (
+                branches - self.arc_counts.keys()
             )
             self.json_report = [
                 [
@@ -212,7 +213,7 @@ class Pool:
         # Either update the arc counts so we can prioritize rarer branches in future,
         # or save an example with new coverage and reset the counter because we'll
         # have a different distribution with a new seed pool.
-        if branches.issubset(self.arc_counts):
+        if seen_all_branches:
             self.arc_counts.update(branches)
         else:
             # Reset our seen arc counts.  This is essential because changing our
@@ -224,7 +225,7 @@ class Pool:
             if result.buffer not in self.results:
                 self.results[result.buffer] = result
             self._database.save(self._fuzz_key, buf)
-            for arc in branches - set(self.covering_buffers):
+            for arc in branches - self.covering_buffers.keys():
                 self.covering_buffers[arc] = buf
 
             # We've just finished making some tricky changes, so this is a good time
@@ -249,26 +250,20 @@ class Pool:
         #       branches) isn't currently used because our concept of "branch" is
         #       too large; should only include interesting files + skip branchless
         #       lines of code to keep the size manageable.
-        saved = sorted(
-            set(self._database.fetch(self._key)) - self._loaded_from_database,
-            key=sort_key,
-            reverse=True,
-        )
-        self._loaded_from_database.update(saved)
+        saved = self._fetch_unloaded(self._key)
         for idx in (0, -1):
             if saved:
                 yield saved.pop(idx)
-        seeds = sorted(
-            set(self._database.fetch(self._key + b".fuzz"))
-            - self._loaded_from_database,
-            key=sort_key,
-            reverse=True,
-        )
-        self._loaded_from_database.update(seeds)
-        yield from seeds
+        yield from self._fetch_unloaded(self._fuzz_key)
         yield from saved
         self._check_invariants()
 
+    def _fetch_unloaded(self, key: bytes) -> list[bytes]:
+        """Mark and return not-yet-loaded buffers under `key`, largest first."""
+        buffers = set(self._database.fetch(key)) - self._loaded_from_database
+        self._loaded_from_database.update(buffers)
+        return sorted(buffers, key=sort_key, reverse=True)
+
     def distill(self, fn: Callable[[bytes], ConjectureData], random: Random) -> None:
         """Shrink to a pool of *minimal* covering examples.
 
@@ -322,7 +317,7 @@ class Mutator(abc.ABC):
         self.random = random
 
     def _random_bytes(self, n: int) -> bytes:
-        return bytes(self.random.randint(0, 255) for _ in range(n))
+        return self.random.randbytes(n)
 
     @abc.abstractmethod
     def generate_buffer(self) -> bytes:
@@ -345,12 +340,12 @@ class CrossOverMutator(Mutator):
         # (1 / rarest_arc_count) each item in self.results
         # This is related to the AFL-fast trick, but doesn't track the transition
         # probabilities - just node densities in the markov chain.
-        weights = [
-            1 / min(self.pool.arc_counts[arc] for arc in res.extra_information.branches)
+        # `random.choices()` accepts relative weights, so there's no need to normalize.
+        count = self.pool.arc_counts.__getitem__
+        return [
+            1 / min(map(count, res.extra_information.branches))
             for res in self.pool.results.values()
         ]
-        total = sum(weights)
-        return [x / total for x in weights]
 
     def generate_buffer(self) -> bytes:
         """Splice together two known valid buffers with some random infill.
@@ -370,12 +365,12 @@ class CrossOverMutator(Mutator):
         # with a `start_example()` boundary.  This is tricky to get out of Hypothesis
         # at the moment though, and we don't have any facilities (beyond luck!)
         # to line up the postfix boundary correctly.  Requires upstream changes.
-        buffer = (
-            prefix[: self.random.randint(0, len(prefix))]
-            + self._random_bytes(self.random.randint(0, 9))
-            + postfix[: self.random.randint(0, len(postfix))]
+        # randrange(n + 1) draws the same values as randint(0, n), minus a call.
+        buffer: bytes = (
+            prefix[: self.random.randrange(len(prefix) + 1)]
+            + self._random_bytes(self.random.randrange(10))
+            + postfix[: self.random.randrange(len(postfix) + 1)]
         )
-        assert isinstance(buffer, bytes)
         return buffer
 
 
@@ -98,6 +98,13 @@ class CollectionContext:
         # coverage.Coverage.current()._data.update(self.cov._data)
 
 
+# Each distinct ((fname, line), (fname, line)) transition seen by the custom
+# tracer is interned to a small int, which is much cheaper to hash than the
+# nested tuple in all the set and counter operations done by the seed pool.
+# The ids are only meaningful within this process, which is all we need.
+_BRANCH_IDS: dict[tuple, int] = {}
+
+
 class CustomCollectionContext:
     """Collect coverage data as a context manager.
 
@@ -115,15 +122,18 @@ class CustomCollectionContext:
             fname = frame.f_code.co_filename
             if not is_hypothesis_file(fname):
                 this = (fname, frame.f_lineno)
-                self.branches.add((self.last, this))
+                self._arcs.add((self.last, this))
                 self.last = this
         return self.trace
 
     def __enter__(self) -> None:
         self.last = None
-        self.branches: set[tuple] = set()
+        self._arcs: set[tuple] = set()
+        self.branches: set[int] = set()
         self.prev_trace = sys.gettrace()
         sys.settrace(self.trace)
 
     def __exit__(self, _type: Exception, _value: object, _traceback: object) -> None:
         sys.settrace(self.prev_trace)
+        ids = _BRANCH_IDS
+        self.branches = {ids.setdefault(arc, len(ids)) for arc in self._arcs}
@@ -1,7 +1,10 @@
 import json
+import os
+import threading
+import warnings
 from collections.abc import Iterable
 from functools import cache
-from typing import Union
+from typing import Optional, Union
 
 from hypothesis import settings
 from hypothesis.database import BackgroundWriteDatabase, ExampleDatabase
@@ -36,11 +39,94 @@ class HypofuzzDatabase:
         return map(json.loads, self._db.fetch(metadata_key(key)))
 
 
+class BackgroundWriteError(Exception):
+    pass
+
+
+def _wait_for_writes(wrapper: BackgroundWriteDatabase) -> None:
+    # BackgroundWriteDatabase._join() waits until the queue is empty, but the writer
+    # thread dies if a save or delete raises, and then the queue never drains.  So we
+    # wait in short steps, and give up if there's no thread left to do the work.
+    queue = wrapper._queue
+    with queue.all_tasks_done:
+        while queue.unfinished_tasks:
+            if not wrapper._thread.is_alive():
+                raise BackgroundWriteError(
+                    f"Background writer for {wrapper._db!r} died with "
+                    f"{queue.unfinished_tasks} writes still pending"
+                )
+            queue.all_tasks_done.wait(0.1)
+
+
+class _BackgroundWriteDatabase(BackgroundWriteDatabase):
+    # fetch() waits for pending writes first, so if the writer has died we raise
+    # rather than hanging, as a failed write would have done before we deferred it.
+    # The finalizer which drains the queue at exit passes a timeout, and there we
+    # can only warn.
+    def _join(self, timeout: Optional[float] = None) -> None:
+        try:
+            _wait_for_writes(self)
+        except BackgroundWriteError as err:
+            if timeout is None:
+                raise
+            warnings.warn(str(err), stacklevel=2)
+
+
+# Each underlying database gets a single writer thread, shared between the metadata
+# db below and the seed pool of every fuzz target.  We key on identity because
+# Hypothesis databases may define __eq__ without __hash__, and keep a reference to
+# the database alongside its wrapper so that the id can't be reused.  The lock makes
+# this safe to call from concurrent `FuzzProcess.startup()` threads.
+_background_writers: dict[int, tuple[ExampleDatabase, BackgroundWriteDatabase]] = {}
+_background_writers_lock = threading.Lock()
+
+
+def with_background_writes(db: ExampleDatabase) -> BackgroundWriteDatabase:
+    with _background_writers_lock:
+        if id(db) not in _background_writers:
+            wrapper = (
+                db
+                if isinstance(db, BackgroundWriteDatabase)
+                else _BackgroundWriteDatabase(db)
+            )
+            _background_writers[id(db)] = (db, wrapper)
+        return _background_writers[id(db)][1]
+
+
+def flush_background_writes() -> None:
+    """Wait until every deferred database write has been completed.
+
+    Fuzz worker processes end with `os._exit()`, which skips the finalizers that
+    would otherwise drain these queues, so call this before the worker stops.
+    Writes queued for a writer thread which has died are lost, and we warn about
+    them rather than raising, so that we still flush the other writers and don't
+    hide whatever exception is ending the fuzz loop.
+    """
+    with _background_writers_lock:
+        wrappers = [wrapper for _, wrapper in _background_writers.values()]
+    for wrapper in wrappers:
+        try:
+            _wait_for_writes(wrapper)
+        except BackgroundWriteError as err:
+            warnings.warn(str(err), stacklevel=2)
+
+
 # cache to make the db a singleton. We defer creation until first-usage to ensure
 # that we use the test-time database setting, rather than init-time.
 @cache
 def get_db() -> HypofuzzDatabase:
-    db = settings().database
-    if isinstance(db, BackgroundWriteDatabase):
-        return HypofuzzDatabase(db)
-    return HypofuzzDatabase(BackgroundWriteDatabase(db))
+    return HypofuzzDatabase(with_background_writes(settings().database))
+
+
+def _reset_after_fork() -> None:
+    global _background_writers_lock
+    _background_writers_lock = threading.Lock()
+    _background_writers.clear()
+    get_db.cache_clear()
+
+
+# A forked child inherits these caches, but not the writer threads of the cached
+# BackgroundWriteDatabase objects, so it must create its own.  The lock might have
+# been held by another thread at the time of the fork, so we replace that too.
+if hasattr(os, "register_at_fork"):  # pragma: no branch  # not on Windows
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,15 +1,18 @@
 """Adaptive fuzzing for property-based tests using Hypothesis."""
 
 import contextlib
+import heapq
 import itertools
 import os
 import socket
 import sys
 import time
 import traceback
-from collections.abc import Callable, Generator
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import suppress
 from functools import lru_cache
+from inspect import Signature
 from random import Random
 from typing import Any, Optional, Union
 
@@ -30,11 +33,15 @@ from hypothesis.internal.conjecture.junkdrawer import stack_depth_of_caller
 from hypothesis.internal.reflection import function_digest, get_signature
 from hypothesis.reporting import with_reporter
 from hypothesis.vendor.pretty import RepresentationPrinter
-from sortedcontainers import SortedKeyList
 
 from .corpus import BlackBoxMutator, CrossOverMutator, HowGenerated, Pool, get_shrinker
 from .cov import CustomCollectionContext
-from .database import Report, get_db
+from .database import (
+    Report,
+    flush_background_writes,
+    get_db,
+    with_background_writes,
+)
 
 record_pytrace: Optional[Callable[..., Any]]
 try:
@@ -42,26 +49,63 @@ try:
 except ImportError:
     record_pytrace = None
 
+# The all-zeros buffer is the "simplest" input for every test, so we replay it at
+# startup.  Bytes are immutable, so one shared instance serves every target.
+ZERO_BUFFER = bytes(BUFFER_SIZE)
+
+
+class constant_stack_depth:
+    """Context manager which ensures the test gets a full recursion limit of stack.
+
+    fuzz_several enters this once for the whole session.  `_run_test_on` also enters
+    it for each input, which does the real work only when `run_one` is called
+    directly; under an enclosing use it's just a flag check, so there's no frame
+    walk and no `setrecursionlimit()` call per input.
+    """
 
-@contextlib.contextmanager
-def constant_stack_depth() -> Generator[None, None, None]:
     # TODO: consider extracting this upstream so we can just import it.
-    recursion_limit = sys.getrecursionlimit()
-    depth = stack_depth_of_caller()
-    # Because we add to the recursion limit, to be good citizens we also add
-    # a check for unbounded recursion.  The default limit is 1000, so this can
-    # only ever trigger if something really strange is happening and it's hard
-    # to imagine an intentionally-deeply-recursive use of this code.
-    assert depth <= 1000, (
-        f"Hypothesis would usually add {recursion_limit} to the stack depth of "
-        f"{depth} here, but we are already much deeper than expected.  Aborting "
-        "now, to avoid extending the stack limit in an infinite loop..."
-    )
-    try:
+    # Like the recursion limit itself, this flag is process-global state and not
+    # thread-safe: only use this from the thread that runs the tests.
+    _active = False
+
+    def __enter__(self) -> None:
+        self.recursion_limit: Optional[int] = None
+        if constant_stack_depth._active:
+            # An enclosing call has already raised the limit, e.g. fuzz_several does
+            # so once for the whole session.
+            return
+        recursion_limit = sys.getrecursionlimit()
+        depth = stack_depth_of_caller()
+        # Because we add to the recursion limit, to be good citizens we also add
+        # a check for unbounded recursion.  The default limit is 1000, so this can
+        # only ever trigger if something really strange is happening and it's hard
+        # to imagine an intentionally-deeply-recursive use of this code.
+        assert depth <= 1000, (
+            f"Hypothesis would usually add {recursion_limit} to the stack depth of "
+            f"{depth} here, but we are already much deeper than expected.  Aborting "
+            "now, to avoid extending the stack limit in an infinite loop..."
+        )
         sys.setrecursionlimit(depth + recursion_limit)
-        yield
-    finally:
-        sys.setrecursionlimit(recursion_limit)
+        self.recursion_limit = recursion_limit
+        constant_stack_depth._active = True
+
+    def __exit__(self, *args: object) -> None:
+        if self.recursion_limit is not None:
+            constant_stack_depth._active = False
+            sys.setrecursionlimit(self.recursion_limit)
+
+
+@lru_cache
+def _get_signature(fn: Callable) -> Signature:
+    return get_signature(fn)
+
+
+@lru_cache
+def _function_digest(fn: Callable, add_digest: Optional[bytes]) -> bytes:
+    # Hypothesis distinguishes parametrized cases by setting an attribute on the
+    # test function which function_digest() reads, so that must be part of our key.
+    digest: bytes = function_digest(fn)
+    return digest
 
 
 class HitShrinkTimeoutError(Exception):
@@ -95,13 +139,16 @@ class FuzzProcess:
             arguments=(),
             kwargs=extra_kw or {},
             given_kwargs=wrapped_test.hypothesis._given_kwargs,
-            params=get_signature(wrapped_test).parameters,
+            params=_get_signature(wrapped_test).parameters,
         )
+        inner_test = wrapped_test.hypothesis.inner_test
         return cls(
-            test_fn=wrapped_test.hypothesis.inner_test,
+            test_fn=inner_test,
             stuff=stuff,
             nodeid=nodeid,
-            database_key=function_digest(wrapped_test.hypothesis.inner_test),
+            database_key=_function_digest(
+                inner_test, getattr(inner_test, "_hypothesis_internal_add_digest", None)
+            ),
             hypothesis_database=getattr(
                 wrapped_test, "_hypothesis_internal_use_settings", settings.default
             ).database
@@ -149,6 +196,11 @@ class FuzzProcess:
 
     def startup(self) -> None:
         """Set up initial state and prepare to replay the saved behaviour."""
+        # The pool saves whenever we find new coverage, so we defer those writes to a
+        # background thread rather than blocking the fuzz loop on disk or network
+        # latency.  This happens here rather than in __init__ because the fuzz CLI
+        # builds FuzzProcess objects and then forks, and threads don't survive fork.
+        self.pool._database = with_background_writes(self.pool._database)
         # If we're continuing to fuzz something we've tested before, load some stats
         if metadata := list(get_db().fetch_metadata(self.database_key)):
             latest: Any = max(metadata, key=lambda d: d["elapsed_time"])  # type: ignore
@@ -161,7 +213,7 @@ class FuzzProcess:
         # behaviours we've observed to date.  Replaying takes longer than restoring
         # our data structures directly, but copes much better with changed behaviour.
         self._replay_buffer.extend(self.pool.fetch())
-        self._replay_buffer.append(b"\x00" * BUFFER_SIZE)
+        self._replay_buffer.append(ZERO_BUFFER)
 
     def generate_prefix(self) -> bytes:
         """Generate a test prefix by mutating previous examples.
@@ -303,8 +355,12 @@ class FuzzProcess:
         except failure_exceptions_to_catch() as e:
             data.status = Status.INTERESTING
             tb = get_trimmed_traceback()
-            filename, lineno, *_ = traceback.extract_tb(tb)[-1]
-            data.interesting_origin = (type(e), filename, lineno)
+            # We only need the innermost frame, so read it from the traceback directly.
+            last = tb
+            while last.tb_next is not None:
+                last = last.tb_next
+            filename = last.tb_frame.f_code.co_filename
+            data.interesting_origin = (type(e), filename, last.tb_lineno)
             data.extra_information.traceback = "".join(
                 traceback.format_exception(type(e), value=e, tb=tb)
             )
@@ -319,13 +375,17 @@ class FuzzProcess:
         # the `hypothesis.event()` function - exploiting user-defined partitions
         # designed for diagnostic output to guide generation.  See
         # https://hypothesis.readthedocs.io/en/latest/details.html#hypothesis.event
-        data.extra_information.branches = frozenset(
+        branches = frozenset(
             getattr(collector, "branches", ())  # might be a debug tracer instead
-        ).union(
-            f"event:{k}:{v}"
-            for k, v in data.events.items()
-            if not k.startswith(("invalid because", "Retried draw from "))
         )
+        if data.events:
+            # Most tests don't use events, so skip the extra copy in that case.
+            branches = branches.union(
+                f"event:{k}:{v}"
+                for k, v in data.events.items()
+                if not k.startswith(("invalid because", "Retried draw from "))
+            )
+        data.extra_information.branches = branches
 
         data.freeze()
         # Update the pool and report any changes immediately for new coverage.  If no
@@ -364,6 +424,9 @@ class FuzzProcess:
     @property
     def _json_description(self) -> Report:
         """Summarise current state to send to dashboard."""
+        # This must build a fresh dict each time: `_report` keeps the previous report
+        # and deletes it by its serialized value; if we mutated a cached dict, that
+        # delete would remove the report we just saved and leave the stale one behind.
         if self.ninputs == 0:
             return {
                 "nodeid": self.nodeid,
@@ -407,32 +470,68 @@ class FuzzProcess:
 
 
 def fuzz_several(*targets_: FuzzProcess, random_seed: Optional[int] = None) -> None:
-    """Take N fuzz targets and run them all."""
-    # TODO: this isn't actually multi-process yet, and that's bad.
+    """Take N fuzz targets and run them all.
+
+    This function runs in a single process; `hypothesis fuzz -n N` gets its
+    parallelism by starting N worker processes (see `entrypoint._fuzz_impl`), each
+    of which collects its own subset of the tests and calls this function.  These
+    subsets are disjoint unless `--unsafe` is passed, in which case every worker
+    fuzzes all the tests.
+
+    Workers share progress through the Hypothesis database: each saves covering
+    examples under the test's `.fuzz` key, and `FuzzProcess.run_one` periodically
+    replays any examples found by other workers.
+    """
     rand = Random(random_seed)
-    targets = SortedKeyList(targets_, lambda t: t.since_new_cov)
+    # A min-heap of (since_new_cov, tiebreak, target), so the target which most
+    # recently found new coverage is at heap[0].  The tiebreak counts down so that
+    # a re-pushed target stays ahead of others with an equal key, and it's unique
+    # so we never fall back to comparing FuzzProcess objects.
+    tiebreak = itertools.count(0, -1)
+    heap = [(t.since_new_cov, next(tiebreak), t) for t in targets_]
+    heapq.heapify(heap)
+
+    # Loading each target's saved examples and metadata is dominated by database
+    # latency, so we overlap it across targets.  We wait for every target to finish
+    # before fuzzing any of them, so that our own writes can't race these reads.
+    # Each target's startup wraps its database via the locked with_background_writes(),
+    # so targets sharing a database share one writer.  get_db() is an unlocked cache,
+    # so we create the metadata db here rather than racing in the loader threads.
+    get_db()
+    with ThreadPoolExecutor() as executor:
+        list(executor.map(lambda t: t.startup(), targets_))
 
     # Loop forever: at each timestep, we choose a target using an epsilon-greedy
     # strategy for simplicity (TODO: improve this later) and run it once.
     # TODO: make this aware of test runtime, so it adapts for branches-per-second
     #       rather than branches-per-input.
-    for t in targets:
-        t.startup()
-    for i in itertools.count():
-        if i % 20 == 0:
-            t = targets.pop(rand.randrange(len(targets)))
-            t.run_one()
-            targets.add(t)
-        else:
-            targets[0].run_one()
-            if len(targets) > 1 and targets.key(targets[0]) > targets.key(targets[1]):
-                # pay our log-n cost to keep the list sorted
-                targets.add(targets.pop(0))
-            elif targets[0].has_found_failure:
-                print(f"found failing example for {targets[0].nodeid}")
-                targets.pop(0)
-            if not targets:
-                return
+    #
+    # Fuzzing usually ends with a KeyboardInterrupt, and workers then exit via
+    # os._exit() - so however we leave the loop, finish any deferred writes first.
+    try:
+        with constant_stack_depth():
+            for i in itertools.count():
+                idx = rand.randrange(len(heap)) if i % 20 == 0 else 0
+                t = heap[idx][2]
+                t.run_one()
+                if t.has_found_failure:
+                    print(f"found failing example for {t.nodeid}")
+                    # Make sure the failure is saved before we stop fuzzing this
+                    # target, in case it was the last one and the worker now exits.
+                    flush_background_writes()
+                    heap[idx] = heap[-1]
+                    heap.pop()
+                    if not heap:
+                        return
+                    heapq.heapify(heap)
+                elif idx == 0:
+                    heapq.heapreplace(heap, (t.since_new_cov, next(tiebreak), t))
+                else:
+                    # Exploration steps are rare, so just restore the heap invariant.
+                    heap[idx] = (t.since_new_cov, next(tiebreak), t)
+                    heapq.heapify(heap)
+    finally:
+        flush_background_writes()
     raise NotImplementedError("unreachable")
 
 
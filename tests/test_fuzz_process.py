@@ -1,9 +1,21 @@
 """Tests for the hypofuzz library."""
 
-from hypothesis import given, strategies as st
+import multiprocessing
+import sys
+import time
+
+import pytest
+from hypothesis import given, settings, strategies as st
+from hypothesis.database import DirectoryBasedExampleDatabase, InMemoryExampleDatabase
 from hypothesis.internal.conjecture.data import Status
 
-from hypofuzz.hy import FuzzProcess
+from hypofuzz import database
+from hypofuzz.database import (
+    BackgroundWriteError,
+    flush_background_writes,
+    with_background_writes,
+)
+from hypofuzz.hy import FuzzProcess, constant_stack_depth, fuzz_several
 
 
 @given(st.integers())
@@ -43,3 +55,96 @@ def test_fuzz_one_process_explain_mode():
     assert not rest  # expected only one failure
     assert tb_repr.endswith("test_fuzz_process.CustomError: x=1\n")
     assert call_repr == "failing_pbt(\n    x=1,\n    y=0,\n)"
+
+
+def test_fuzz_several_stops_once_every_target_has_failed():
+    targets = [FuzzProcess.from_hypothesis_test(failing_pbt) for _ in range(3)]
+    fuzz_several(*targets, random_seed=0)
+    assert all(t.has_found_failure for t in targets)
+
+
+needs_fork = pytest.mark.skipif(
+    "fork" not in multiprocessing.get_all_start_methods(), reason="needs fork"
+)
+
+
+def _run_in_forked_worker(target, *args):
+    # Like the workers of `hypothesis fuzz -n N`.  If the worker hangs we kill it,
+    # because multiprocessing would otherwise join it at exit and hang pytest too.
+    proc = multiprocessing.get_context("fork").Process(target=target, args=args)
+    proc.start()
+    proc.join(timeout=60)
+    if proc.is_alive():
+        proc.kill()
+        proc.join()
+        pytest.fail(f"{target.__name__} hung in a forked worker")
+    assert proc.exitcode == 0
+
+
+def _fuzz_then_reload(fp):
+    fp.startup()
+    for _ in range(10):
+        fp.run_one()  # finds new coverage, and so saves to the database
+    list(fp.pool.fetch())  # waits for any pending writes to finish
+
+
+@needs_fork
+def test_fuzz_process_in_forked_worker():
+    # Regression test: `hypothesis fuzz -n N` builds FuzzProcess objects in the
+    # parent, then forks workers.  A database writer thread started before the fork
+    # doesn't exist in the child, so its queued writes would block forever.
+    fp = FuzzProcess.from_hypothesis_test(pbt)
+    _run_in_forked_worker(_fuzz_then_reload, fp)
+
+
+class SlowDatabase(DirectoryBasedExampleDatabase):
+    # Stands in for a networked backend, where writes take a while.
+    def save(self, key, value):
+        time.sleep(0.05)
+        super().save(key, value)
+
+
+@needs_fork
+def test_forked_worker_persists_failing_example(tmp_path):
+    # Worker processes end with os._exit(), which skips the hooks that would
+    # otherwise drain deferred database writes - so fuzz_several must do so.
+    db = SlowDatabase(tmp_path)
+
+    @settings(database=db)
+    @given(st.integers(0, 10), st.integers(0, 10))
+    def failing(x, y):
+        if x:
+            raise CustomError(f"x={x}")
+
+    fp = FuzzProcess.from_hypothesis_test(failing)
+    _run_in_forked_worker(fuzz_several, fp)
+    assert len(list(db.fetch(fp.database_key))) >= 1
+
+
+class BrokenDatabase(InMemoryExampleDatabase):
+    # Stands in for a networked backend whose connection has dropped.
+    def save(self, key, value):
+        raise ConnectionError("database is down")
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_dead_background_writer_does_not_hang(monkeypatch):
+    # A write that raises kills the writer thread, so its queue never drains.
+    monkeypatch.setattr(database, "_background_writers", {})
+    db = with_background_writes(BrokenDatabase())
+    db.save(b"key", b"value")
+    with pytest.warns(UserWarning, match="writes still pending"):
+        flush_background_writes()
+    with pytest.raises(BackgroundWriteError):
+        list(db.fetch(b"key"))
+
+
+def test_nested_constant_stack_depth_keeps_outer_limit():
+    limit = sys.getrecursionlimit()
+    with constant_stack_depth():
+        raised = sys.getrecursionlimit()
+        assert raised > limit
+        with constant_stack_depth():
+            assert sys.getrecursionlimit() == raised
+        assert sys.getrecursionlimit() == raised
+    assert sys.getrecursionlimit() == limit